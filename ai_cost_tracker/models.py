@@ -2,14 +2,47 @@
 
 from __future__ import annotations
 
+import sys
+import time
 from dataclasses import dataclass, field
-from datetime import datetime, timezone
-from typing import Any, Dict
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Optional
 
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_MICROSECOND = timedelta(microseconds=1)
 
-@dataclass
+# `slots=True` needs Python 3.10+; older interpreters keep a per-instance dict.
+_DATACLASS_OPTIONS: Dict[str, Any] = {"slots": True} if sys.version_info >= (3, 10) else {}
+
+
+def datetime_to_epoch_us(value: datetime) -> int:
+    """Convert a datetime to integer microseconds since the Unix epoch.
+
+    Naive datetimes are interpreted as UTC.
+    """
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return (value - _EPOCH) // _MICROSECOND
+
+
+def epoch_us_to_datetime(value: int) -> datetime:
+    """Convert integer microseconds since the Unix epoch to a UTC datetime."""
+    return datetime.fromtimestamp(value / 1_000_000, timezone.utc)
+
+
+def epoch_us_now() -> int:
+    """Return the current time as integer microseconds since the Unix epoch."""
+    return time.time_ns() // 1000
+
+
+@dataclass(**_DATACLASS_OPTIONS)
 class CostLog:
-    """Single record of LLM usage cost."""
+    """Single record of LLM usage cost.
+
+    `epoch_us` is the event time the storage writes. When `timestamp` is given
+    it takes precedence and `epoch_us` is derived from it; otherwise
+    `timestamp` is built from `epoch_us`, which defaults to the current time.
+    """
 
     user_id: str
     feature: str
@@ -18,9 +51,18 @@ class CostLog:
     tokens_out: int
     cost_usd: float
     latency_ms: int
-    timestamp: datetime = field(default_factory=lambda: datetime.now(timezone.utc))
+    timestamp: Optional[datetime] = None
     org_id: str = "default"
     metadata: Dict[str, Any] = field(default_factory=dict)
+    epoch_us: Optional[int] = None
+
+    def __post_init__(self) -> None:
+        if self.timestamp is not None:
+            self.epoch_us = datetime_to_epoch_us(self.timestamp)
+            return
+        if self.epoch_us is None:
+            self.epoch_us = epoch_us_now()
+        self.timestamp = epoch_us_to_datetime(self.epoch_us)
 
     def to_dict(self) -> Dict[str, Any]:
         """Serialize this log entry as a JSON-friendly dictionary."""
@@ -36,3 +78,4 @@ class CostLog:
             "org_id": self.org_id,
             "metadata": self.metadata,
         }
+
@@ -2,7 +2,8 @@
 
 from __future__ import annotations
 
-from typing import Dict, Tuple
+from functools import lru_cache
+from typing import Callable, Dict, Tuple
 
 # USD per 1M tokens: (input, output)
 PRICING: Dict[str, Tuple[float, float]] = {
@@ -23,24 +24,49 @@ _ALIASES = {
     "claude-3-opus": "claude-opus-4",
 }
 
+# Exact pricing keys and aliases, resolved with a single dict lookup.
+_DIRECT: Dict[str, str] = {**{key: key for key in PRICING}, **_ALIASES}
+_ALIAS_PREFIXES: Tuple[Tuple[str, str], ...] = tuple(_ALIASES.items())
+# Prefer more specific keys first when falling back to prefix/substring matches.
+_PREFIX_SORTED: Tuple[str, ...] = tuple(sorted(PRICING, key=len, reverse=True))
+
+
+CostFn = Callable[[int, int], float]
+
+
+def _make_cost_fn(input_per_million: float, output_per_million: float) -> CostFn:
+    def cost(tokens_in: int, tokens_out: int) -> float:
+        input_cost = (tokens_in / 1_000_000.0) * input_per_million
+        output_cost = (tokens_out / 1_000_000.0) * output_per_million
+        return input_cost + output_cost
+
+    return cost
+
+
+# One cost function per pricing key with its rates bound in a closure.
+_COST_FNS: Dict[str, CostFn] = {
+    key: _make_cost_fn(input_per_million, output_per_million)
+    for key, (input_per_million, output_per_million) in PRICING.items()
+}
+
 
 def _normalize_model_name(model: str) -> str:
     return model.strip().lower().replace("_", "-")
 
 
+@lru_cache(maxsize=512)
 def _resolve_model_key(model: str) -> str:
     normalized = _normalize_model_name(model)
 
-    if normalized in PRICING:
-        return normalized
+    direct = _DIRECT.get(normalized)
+    if direct is not None:
+        return direct
 
-    for alias_prefix, canonical in _ALIASES.items():
+    for alias_prefix, canonical in _ALIAS_PREFIXES:
         if normalized.startswith(alias_prefix):
             return canonical
 
-    # Prefer more specific keys first, then allow prefix/substring matches.
-    keys_by_specificity = sorted(PRICING.keys(), key=len, reverse=True)
-    for key in keys_by_specificity:
+    for key in _PREFIX_SORTED:
         if normalized.startswith(key) or key in normalized:
             return key
 
@@ -58,7 +84,4 @@ def calculate_cost(model: str, tokens_in: int, tokens_out: int) -> float:
     if tokens_in < 0 or tokens_out < 0:
         raise ValueError("Token counts must be non-negative")
 
-    input_per_million, output_per_million = get_model_pricing(model)
-    input_cost = (tokens_in / 1_000_000.0) * input_per_million
-    output_cost = (tokens_out / 1_000_000.0) * output_per_million
-    return float(input_cost + output_cost)
+    return _COST_FNS[_resolve_model_key(model)](tokens_in, tokens_out)
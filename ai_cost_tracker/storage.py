@@ -2,13 +2,132 @@
 
 from __future__ import annotations
 
+import atexit
+import heapq
+import itertools
 import json
+import logging
+import os
+import queue
 import sqlite3
+import time
+import weakref
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import datetime
 from pathlib import Path
-from threading import Lock
-from typing import Any, Dict, List, Optional, Sequence, Tuple
+from threading import Event, Lock, Thread, local
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple, Union
 
-from .models import CostLog
+from .models import CostLog, datetime_to_epoch_us
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional dependency
+    orjson = None
+
+logger = logging.getLogger(__name__)
+
+# Maximum number of pending log entries (across all lanes) before `log()` falls
+# back to a synchronous insert on the caller thread.
+_QUEUE_MAXSIZE = 10_000
+# Producer threads are spread over this many writer queue lanes.
+_QUEUE_LANES = min(8, os.cpu_count() or 1)
+# Maximum number of entries written per transaction by the writer thread.
+_MAX_BATCH = 500
+# How long a busy writer waits for a batch to fill before committing it.
+_MAX_LINGER_S = 0.05
+# A failing batch transaction (e.g. SQLITE_BUSY) is retried this many times,
+# with a linearly growing delay, before its entries are counted as dropped.
+_WRITE_ATTEMPTS = 3
+_WRITE_RETRY_DELAY_S = 0.1
+
+_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA mmap_size=268435456",
+    "PRAGMA cache_size=-20000",
+)
+
+_CREATE_TABLE_SQL = """
+CREATE TABLE IF NOT EXISTS cost_logs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id TEXT NOT NULL,
+    feature TEXT NOT NULL,
+    model TEXT NOT NULL,
+    tokens_in INTEGER NOT NULL,
+    tokens_out INTEGER NOT NULL,
+    cost_usd REAL NOT NULL,
+    latency_ms INTEGER NOT NULL,
+    timestamp INTEGER NOT NULL,
+    org_id TEXT NOT NULL,
+    metadata TEXT NOT NULL
+)
+"""
+
+_INSERT_SQL = """
+INSERT INTO cost_logs (
+    user_id, feature, model, tokens_in, tokens_out,
+    cost_usd, latency_ms, timestamp, org_id, metadata
+) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+# Query templates are formatted into a small, repeating set of SQL strings so
+# that sqlite3's per-connection statement cache can reuse compiled statements.
+_TOTAL_SQL = "SELECT COALESCE(SUM(cost_usd), 0.0) AS total FROM cost_logs {where}"
+_GROUPED_SQL = (
+    "SELECT {column}, SUM(cost_usd) AS total, COUNT(*) AS call_count "
+    "FROM cost_logs {where} GROUP BY {column}"
+)
+_TOP_SQL = _GROUPED_SQL + " ORDER BY total DESC LIMIT ?"
+
+_TOTAL_SQL_NO_FILTER = _TOTAL_SQL.format(where="")
+_GROUPED_SQL_NO_FILTER = {
+    column: _GROUPED_SQL.format(column=column, where="") for column in ("user_id", "feature")
+}
+
+_DATA_VERSION_SQL = "PRAGMA data_version"
+# Aggregate reloads scan without holding the writer lock; a reload that keeps
+# racing local commits falls back to scanning under the lock.
+_SYNC_ATTEMPTS = 3
+
+_CACHED_STATEMENTS = 256
+
+# Filtered query results are reused until the writer commits or this many
+# seconds pass (the TTL bounds staleness from other processes' writes).
+_RESULT_CACHE_TTL_S = 1.0
+_RESULT_CACHE_SIZE = 128
+
+TimeValue = Union[datetime, int, str]
+
+_EMPTY_METADATA = "{}"
+
+if orjson is not None:
+
+    def _dump_metadata(metadata: Dict[str, Any]) -> str:
+        # orjson rejects some values json.dumps accepts (e.g. ints wider than
+        # 64 bits); those fall back to the stdlib encoder. Note that orjson
+        # writes NaN/Infinity as null and emits non-ASCII text unescaped.
+        try:
+            return orjson.dumps(metadata, option=orjson.OPT_NON_STR_KEYS).decode()
+        except TypeError:
+            return json.dumps(metadata, ensure_ascii=True)
+
+else:  # pragma: no cover - optional dependency
+
+    def _dump_metadata(metadata: Dict[str, Any]) -> str:
+        return json.dumps(metadata, ensure_ascii=True)
+
+
+class _Reader:
+    """A thread's read-only connection, closed once the thread's locals are freed."""
+
+    __slots__ = ("conn", "close", "__weakref__")
+
+    def __init__(self, conn: sqlite3.Connection) -> None:
+        self.conn = conn
+        self.close = weakref.finalize(self, conn.close)
 
 
 class SQLiteStorage:
@@ -18,121 +137,479 @@ class SQLiteStorage:
         self.db_path = db_path
         db_parent = Path(db_path).expanduser().resolve().parent
         db_parent.mkdir(parents=True, exist_ok=True)
-        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        # Autocommit mode: transactions are opened explicitly so that each
+        # writer batch is exactly one transaction.
+        self._conn = sqlite3.connect(
+            db_path,
+            check_same_thread=False,
+            isolation_level=None,
+            cached_statements=_CACHED_STATEMENTS,
+        )
         self._conn.row_factory = sqlite3.Row
         self._lock = Lock()
+        self._configure_connection()
         self._init_db()
 
+        # Filtered query results keyed by `(query, where_sql, params, limit)`,
+        # stored as `(version, created_at, result)`. `_version` is bumped by
+        # every local commit, which invalidates all cached results at once.
+        self._version = 0
+        self._result_cache: "OrderedDict[Tuple[Any, ...], Tuple[int, float, Any]]" = (
+            OrderedDict()
+        )
+        self._result_cache_lock = Lock()
+
+        # Each reader thread gets its own read-only connection; WAL gives them
+        # a consistent snapshot without taking the writer lock. In-memory
+        # databases cannot be shared, so they read through `_conn` instead.
+        # Readers are tracked weakly: a thread's connection is closed when the
+        # thread exits, and `close()` closes those still in use.
+        self._read_uri: Optional[str] = None
+        if db_path and db_path != ":memory:" and not db_path.startswith("file:"):
+            self._read_uri = f"{Path(db_path).resolve().as_uri()}?mode=ro"
+        self._tls = local()
+        self._readers: "weakref.WeakSet[_Reader]" = weakref.WeakSet()
+
+        # Running per-user and per-feature `[total_cost, call_count]` pairs let
+        # unfiltered queries skip the GROUP BY scan. They are reloaded from
+        # the table whenever another connection commits to the database.
+        self._grand_total = 0.0
+        self._totals: Dict[str, Dict[str, List[Any]]] = {"user_id": {}, "feature": {}}
+        self._data_version = -1
+        self._sync_aggregates()
+
+        # Producers are assigned a lane round-robin on first use, so concurrent
+        # callers rarely contend on the same queue. `_wakeup` is only set when
+        # it is clear, keeping the common enqueue path lock-free.
+        self._lanes: List["queue.SimpleQueue[Any]"] = [
+            queue.SimpleQueue() for _ in range(_QUEUE_LANES)
+        ]
+        # The bound applies to all lanes together, since a single producer
+        # (e.g. an event loop) only ever fills its own lane. Lanes below an
+        # even share of it skip summing the other lanes' sizes.
+        self._lane_share = max(1, _QUEUE_MAXSIZE // _QUEUE_LANES)
+        self._next_lane = itertools.count()
+        self._wakeup = Event()
+        self._stopping = False
+        self._closed = False
+        self._dropped = 0
+        # The writer thread and the exit hook only hold weak references, so a
+        # storage that is never closed can still be collected; its finalizer
+        # then writes leftover entries and lets the writer thread exit.
+        self._writer = Thread(
+            target=_run_writer,
+            args=(weakref.ref(self), self._wakeup),
+            name="ai-cost-tracker-writer",
+            daemon=True,
+        )
+        self._writer.start()
+        self._finalizer = weakref.finalize(
+            self, _release_unclosed, self._conn, self._lanes, self._wakeup, self._readers
+        )
+        self._finalizer.atexit = False
+        _OPEN_STORAGES.add(self)
+
+    def _configure_connection(self) -> None:
+        """Switch to WAL so readers never block on the writer, and tune caching."""
+        for pragma in _PRAGMAS:
+            self._conn.execute(pragma)
+
     def _init_db(self) -> None:
         """Create required schema and indexes if they do not exist."""
         with self._lock:
-            cursor = self._conn.cursor()
-            cursor.execute(
-                """
-                CREATE TABLE IF NOT EXISTS cost_logs (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    user_id TEXT NOT NULL,
-                    feature TEXT NOT NULL,
-                    model TEXT NOT NULL,
-                    tokens_in INTEGER NOT NULL,
-                    tokens_out INTEGER NOT NULL,
-                    cost_usd REAL NOT NULL,
-                    latency_ms INTEGER NOT NULL,
-                    timestamp TEXT NOT NULL,
-                    org_id TEXT NOT NULL,
-                    metadata TEXT NOT NULL
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._migrate_text_timestamps()
+                self._conn.execute(_CREATE_TABLE_SQL)
+                # Covering indexes let per-user/per-feature SUM(cost_usd) be answered
+                # from the index alone; they supersede the single-column ones.
+                self._conn.execute("DROP INDEX IF EXISTS idx_cost_logs_user_id")
+                self._conn.execute("DROP INDEX IF EXISTS idx_cost_logs_feature")
+                self._conn.execute(
+                    "CREATE INDEX IF NOT EXISTS idx_cost_logs_user_cost "
+                    "ON cost_logs(user_id, cost_usd)"
                 )
-                """
-            )
-            cursor.execute(
-                "CREATE INDEX IF NOT EXISTS idx_cost_logs_user_id ON cost_logs(user_id)"
-            )
-            cursor.execute(
-                "CREATE INDEX IF NOT EXISTS idx_cost_logs_feature ON cost_logs(feature)"
-            )
-            cursor.execute(
-                "CREATE INDEX IF NOT EXISTS idx_cost_logs_timestamp ON cost_logs(timestamp)"
-            )
-            cursor.execute(
-                "CREATE INDEX IF NOT EXISTS idx_cost_logs_org_id ON cost_logs(org_id)"
+                self._conn.execute(
+                    "CREATE INDEX IF NOT EXISTS idx_cost_logs_feature_cost "
+                    "ON cost_logs(feature, cost_usd)"
+                )
+                self._conn.execute(
+                    "CREATE INDEX IF NOT EXISTS idx_cost_logs_timestamp ON cost_logs(timestamp)"
+                )
+                self._conn.execute(
+                    "CREATE INDEX IF NOT EXISTS idx_cost_logs_org_id ON cost_logs(org_id)"
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                if self._conn.in_transaction:
+                    self._conn.execute("ROLLBACK")
+                raise
+
+    def _migrate_text_timestamps(self) -> None:
+        """Rewrite tables created with ISO-8601 TEXT timestamps to epoch microseconds.
+
+        Runs inside the `_init_db` transaction.
+        """
+        columns = self._conn.execute("PRAGMA table_info(cost_logs)").fetchall()
+        if not any(
+            column["name"] == "timestamp" and column["type"].upper() == "TEXT"
+            for column in columns
+        ):
+            return
+
+        logger.info("Migrating cost_logs timestamps to INTEGER epoch microseconds")
+        self._conn.create_function("_iso_to_epoch_us", 1, _iso_to_epoch_us)
+        self._conn.execute("ALTER TABLE cost_logs RENAME TO cost_logs_legacy")
+        self._conn.execute(_CREATE_TABLE_SQL)
+        self._conn.execute(
+            """
+            INSERT INTO cost_logs (
+                id, user_id, feature, model, tokens_in, tokens_out,
+                cost_usd, latency_ms, timestamp, org_id, metadata
             )
-            self._conn.commit()
+            SELECT
+                id, user_id, feature, model, tokens_in, tokens_out,
+                cost_usd, latency_ms, _iso_to_epoch_us(timestamp), org_id, metadata
+            FROM cost_logs_legacy
+            """
+        )
+        self._conn.execute("DROP TABLE cost_logs_legacy")
 
     def close(self) -> None:
-        """Close the SQLite connection."""
+        """Write pending entries, stop the writer thread and close the connection."""
+        if self._closed:
+            return
+        self._closed = True
+        _OPEN_STORAGES.discard(self)
+        self._finalizer.detach()
+        self._stopping = True
+        self._wakeup.set()
+        self._writer.join()
+        # Entries enqueued while the writer was exiting are written here.
+        batch: List[CostLog] = []
+        markers: List[Event] = []
+        self._drain_lanes(batch, markers, limit=None)
+        if batch:
+            self._write_batch(batch)
+        for marker in markers:
+            marker.set()
+        for reader in list(self._readers):
+            reader.close()
         with self._lock:
             self._conn.close()
 
+    @property
+    def dropped_logs(self) -> int:
+        """Number of queued entries that could not be persisted and were logged as errors."""
+        return self._dropped
+
+    def flush(self) -> None:
+        """Block until every entry queued so far has been committed."""
+        if not self._writer.is_alive():
+            return
+        markers = [Event() for _ in self._lanes]
+        for lane, marker in zip(self._lanes, markers):
+            lane.put(marker)
+        self._wakeup.set()
+        for marker in markers:
+            marker.wait()
+
     def log(self, cost_log: CostLog) -> None:
-        """Persist a cost log entry."""
-        with self._lock:
-            cursor = self._conn.cursor()
-            cursor.execute(
-                """
-                INSERT INTO cost_logs (
-                    user_id, feature, model, tokens_in, tokens_out,
-                    cost_usd, latency_ms, timestamp, org_id, metadata
-                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                """,
-                (
+        """Queue a cost log entry for the background writer.
+
+        The caller only enqueues the entry; metadata is serialized later on the
+        writer thread, so it must not be mutated after logging. Falls back to a
+        synchronous insert when `_QUEUE_MAXSIZE` entries are pending across all
+        lanes so that entries are never dropped under sustained load.
+        """
+        if self._closed:
+            raise RuntimeError("Cannot log to a closed SQLiteStorage")
+        lane = getattr(self._tls, "lane", None)
+        if lane is None:
+            lane = self._tls.lane = self._lanes[next(self._next_lane) % len(self._lanes)]
+        if lane.qsize() >= self._lane_share and self._pending() >= _QUEUE_MAXSIZE:
+            self._write_batch([cost_log], strict=True)
+            return
+        lane.put(cost_log)
+        if not self._wakeup.is_set():
+            self._wakeup.set()
+
+    def _pending(self) -> int:
+        return sum(lane.qsize() for lane in self._lanes)
+
+    def _write_pending(self) -> bool:
+        """Drain all lanes in batches; return True once `close()` requested a stop."""
+        while True:
+            batch: List[CostLog] = []
+            markers: List[Event] = []
+            self._fill_batch(batch, markers)
+
+            if batch:
+                try:
+                    self._write_batch(batch)
+                except Exception as exc:  # pragma: no cover - defensive path
+                    self._count_dropped(len(batch))
+                    logger.exception("Failed to write %d cost logs: %s", len(batch), exc)
+
+            for marker in markers:
+                marker.set()
+            if not batch and not markers:
+                return self._stopping
+
+    def _fill_batch(self, batch: List[CostLog], markers: List[Event]) -> None:
+        """Collect up to `_MAX_BATCH` entries from the lanes.
+
+        A lone entry is written immediately to keep latency low when idle.
+        When more entries are already waiting, the writer lingers briefly so
+        that bursts share a single commit. Pending flushes skip the linger.
+        """
+        deadline: Optional[float] = None
+        while True:
+            self._drain_lanes(batch, markers, limit=_MAX_BATCH)
+            if len(batch) <= 1 or len(batch) >= _MAX_BATCH or markers or self._stopping:
+                return
+            if deadline is None:
+                deadline = time.monotonic() + _MAX_LINGER_S
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or not self._wakeup.wait(remaining):
+                return
+            self._wakeup.clear()
+
+    def _drain_lanes(
+        self, batch: List[CostLog], markers: List[Event], limit: Optional[int]
+    ) -> None:
+        """Move queued entries into `batch` and flush markers into `markers`."""
+        for lane in self._lanes:
+            while limit is None or len(batch) < limit:
+                try:
+                    item = lane.get_nowait()
+                except queue.Empty:
+                    break
+                if isinstance(item, Event):
+                    markers.append(item)
+                else:
+                    batch.append(item)
+
+    def _write_batch(self, batch: Sequence[CostLog], strict: bool = False) -> None:
+        """Serialize and insert entries in one transaction.
+
+        Runs on the writer thread, or on the caller only when its lane is full.
+        Unless `strict`, an entry that cannot be serialized is logged and
+        skipped without affecting the rest of the batch, and a failing
+        transaction is retried before its entries are counted as dropped.
+        """
+        rows: List[Tuple[Any, ...]] = []
+        written: List[CostLog] = []
+        for cost_log in batch:
+            try:
+                rows.append(_to_row(cost_log))
+            except Exception as exc:
+                if strict:
+                    raise
+                self._count_dropped(1)
+                logger.exception(
+                    "Dropping cost log for user %r: cannot serialize metadata: %s",
                     cost_log.user_id,
-                    cost_log.feature,
-                    cost_log.model,
-                    cost_log.tokens_in,
-                    cost_log.tokens_out,
-                    cost_log.cost_usd,
-                    cost_log.latency_ms,
-                    cost_log.timestamp.isoformat(),
-                    cost_log.org_id,
-                    json.dumps(cost_log.metadata, ensure_ascii=True),
-                ),
+                    exc,
+                )
+                continue
+            written.append(cost_log)
+        if not rows:
+            return
+
+        attempt = 1
+        while True:
+            try:
+                self._insert_rows(rows, written)
+                return
+            except sqlite3.Error as exc:
+                if strict:
+                    raise
+                if attempt >= _WRITE_ATTEMPTS:
+                    self._count_dropped(len(rows))
+                    logger.exception(
+                        "Dropping %d cost logs after %d failed write attempts: %s",
+                        len(rows),
+                        attempt,
+                        exc,
+                    )
+                    return
+                logger.warning("Retrying write of %d cost logs: %s", len(rows), exc)
+                time.sleep(_WRITE_RETRY_DELAY_S * attempt)
+                attempt += 1
+
+    def _insert_rows(self, rows: Sequence[Tuple[Any, ...]], batch: Sequence[CostLog]) -> None:
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.executemany(_INSERT_SQL, rows)
+                self._conn.execute("COMMIT")
+            except Exception:
+                if self._conn.in_transaction:
+                    self._conn.execute("ROLLBACK")
+                raise
+            self._version += 1
+            self._add_to_aggregates(batch)
+
+    def _count_dropped(self, count: int) -> None:
+        with self._lock:
+            self._dropped += count
+
+    def _add_to_aggregates(self, batch: Sequence[CostLog]) -> None:
+        """Fold committed entries into the running totals. Caller holds `_lock`."""
+        users = self._totals["user_id"]
+        features = self._totals["feature"]
+        for cost_log in batch:
+            cost = cost_log.cost_usd
+            self._grand_total += cost
+            for totals, key in ((users, cost_log.user_id), (features, cost_log.feature)):
+                entry = totals.get(key)
+                if entry is None:
+                    totals[key] = [cost, 1]
+                else:
+                    entry[0] += cost
+                    entry[1] += 1
+
+    def _sync_aggregates(self) -> None:
+        """Reload running totals if another connection wrote.
+
+        The tables are scanned on a reader connection so the writer is not
+        blocked; the result is swapped in only if no local commit landed in
+        the meantime, since that commit may be missing from the snapshot.
+        """
+        for _ in range(_SYNC_ATTEMPTS):
+            with self._lock:
+                data_version = self._conn.execute(_DATA_VERSION_SQL).fetchone()[0]
+                if data_version == self._data_version:
+                    return
+                local_version = self._version
+            with self._reading() as conn:
+                grand_total, totals = _load_aggregates(conn)
+            with self._lock:
+                if self._version == local_version:
+                    self._data_version = data_version
+                    self._grand_total, self._totals = grand_total, totals
+                    return
+
+        with self._lock:
+            self._data_version = self._conn.execute(_DATA_VERSION_SQL).fetchone()[0]
+            self._grand_total, self._totals = _load_aggregates(self._conn)
+
+    def _top_from_aggregates(self, column: str, limit: int) -> List[Tuple[str, float, int]]:
+        self._sync_aggregates()
+        with self._lock:
+            totals = self._totals[column]
+            if limit < 0:
+                limit = len(totals)
+            top = heapq.nlargest(limit, totals.items(), key=lambda item: item[1][0])
+            return [(key, float(total), int(count)) for key, (total, count) in top]
+
+    @contextmanager
+    def _reading(self) -> Iterator[sqlite3.Connection]:
+        """Yield a connection for SELECTs, opening this thread's reader lazily."""
+        if self._read_uri is None:
+            with self._lock:
+                yield self._conn
+            return
+
+        reader = getattr(self._tls, "reader", None)
+        if reader is None:
+            conn = sqlite3.connect(
+                self._read_uri,
+                uri=True,
+                check_same_thread=False,
+                cached_statements=_CACHED_STATEMENTS,
             )
-            self._conn.commit()
+            conn.row_factory = sqlite3.Row
+            reader = self._tls.reader = _Reader(conn)
+            self._readers.add(reader)
+        yield reader.conn
 
     def get_total_cost(self, filters: Optional[Dict[str, Any]] = None) -> float:
         """Return total cost in USD for optional filters."""
+        self.flush()
         where_sql, params = self._build_where_clause(filters)
-        query = f"SELECT COALESCE(SUM(cost_usd), 0.0) AS total FROM cost_logs {where_sql}"
+        if not where_sql:
+            self._sync_aggregates()
+            with self._lock:
+                return float(self._grand_total)
 
-        with self._lock:
-            cursor = self._conn.cursor()
-            cursor.execute(query, params)
-            row = cursor.fetchone()
-            return float(row["total"] if row is not None else 0.0)
+        return self._cached(
+            ("total", where_sql, params, None),
+            lambda: self._total_from_sql(where_sql, params),
+        )
 
     def get_top_users(
         self, limit: int = 10, filters: Optional[Dict[str, Any]] = None
     ) -> List[Tuple[str, float, int]]:
         """Return top users as `(user_id, total_cost, call_count)` tuples."""
+        self.flush()
         where_sql, params = self._build_where_clause(filters)
-        query = (
-            "SELECT user_id, SUM(cost_usd) AS total, COUNT(*) AS call_count "
-            f"FROM cost_logs {where_sql} "
-            "GROUP BY user_id ORDER BY total DESC LIMIT ?"
-        )
+        if not where_sql:
+            return self._top_from_aggregates("user_id", limit)
 
-        with self._lock:
-            cursor = self._conn.cursor()
-            cursor.execute(query, (*params, limit))
-            rows = cursor.fetchall()
-            return [(row["user_id"], float(row["total"]), int(row["call_count"])) for row in rows]
+        return list(
+            self._cached(
+                ("user_id", where_sql, params, limit),
+                lambda: self._top_from_sql("user_id", where_sql, params, limit),
+            )
+        )
 
     def get_top_features(
         self, limit: int = 10, filters: Optional[Dict[str, Any]] = None
     ) -> List[Tuple[str, float, int]]:
         """Return top features as `(feature, total_cost, call_count)` tuples."""
+        self.flush()
         where_sql, params = self._build_where_clause(filters)
-        query = (
-            "SELECT feature, SUM(cost_usd) AS total, COUNT(*) AS call_count "
-            f"FROM cost_logs {where_sql} "
-            "GROUP BY feature ORDER BY total DESC LIMIT ?"
+        if not where_sql:
+            return self._top_from_aggregates("feature", limit)
+
+        return list(
+            self._cached(
+                ("feature", where_sql, params, limit),
+                lambda: self._top_from_sql("feature", where_sql, params, limit),
+            )
         )
 
-        with self._lock:
-            cursor = self._conn.cursor()
-            cursor.execute(query, (*params, limit))
-            rows = cursor.fetchall()
-            return [(row["feature"], float(row["total"]), int(row["call_count"])) for row in rows]
+    def _total_from_sql(self, where_sql: str, params: Sequence[Any]) -> float:
+        with self._reading() as conn:
+            row = conn.execute(_TOTAL_SQL.format(where=where_sql), params).fetchone()
+            return float(row["total"] if row is not None else 0.0)
+
+    def _top_from_sql(
+        self, column: str, where_sql: str, params: Sequence[Any], limit: int
+    ) -> Tuple[Tuple[str, float, int], ...]:
+        query = _TOP_SQL.format(column=column, where=where_sql)
+        with self._reading() as conn:
+            rows = conn.execute(query, (*params, limit)).fetchall()
+            return tuple((row[column], float(row["total"]), int(row["call_count"])) for row in rows)
+
+    def _cached(self, key: Tuple[Any, ...], compute: Callable[[], Any]) -> Any:
+        """Return a memoized query result while no commit or TTL expiry intervened."""
+        try:
+            hash(key)
+        except TypeError:
+            return compute()
+
+        now = time.monotonic()
+        with self._result_cache_lock:
+            hit = self._result_cache.get(key)
+            if (
+                hit is not None
+                and hit[0] == self._version
+                and now - hit[1] < _RESULT_CACHE_TTL_S
+            ):
+                self._result_cache.move_to_end(key)
+                return hit[2]
+
+        version = self._version
+        result = compute()
+        with self._result_cache_lock:
+            self._result_cache[key] = (version, now, result)
+            self._result_cache.move_to_end(key)
+            if len(self._result_cache) > _RESULT_CACHE_SIZE:
+                self._result_cache.popitem(last=False)
+        return result
 
     def _build_where_clause(
         self, filters: Optional[Dict[str, Any]] = None
@@ -140,23 +617,151 @@ class SQLiteStorage:
         if not filters:
             return "", ()
 
-        clauses: List[str] = []
+        mask = 0
         params: List[Any] = []
-
-        simple_fields = ("user_id", "feature", "org_id", "model")
-        for field in simple_fields:
+        for bit, (field, _, normalize) in enumerate(_FILTERS):
             value = filters.get(field)
             if value is not None:
-                clauses.append(f"{field} = ?")
-                params.append(value)
+                mask |= 1 << bit
+                params.append(normalize(value) if normalize is not None else value)
+
+        return _WHERE_CACHE[mask], tuple(params)
+
+
+# Storages that have not been closed yet; they are closed at interpreter exit
+# so that queued entries are written.
+_OPEN_STORAGES: "weakref.WeakSet[SQLiteStorage]" = weakref.WeakSet()
+
+
+def _close_open_storages() -> None:
+    for storage in list(_OPEN_STORAGES):
+        storage.close()
+
+
+atexit.register(_close_open_storages)
+
 
-        if filters.get("start_time") is not None:
-            clauses.append("timestamp >= ?")
-            params.append(filters["start_time"])
+def _run_writer(storage_ref: "weakref.ref[SQLiteStorage]", wakeup: Event) -> None:
+    """Writer thread body; the storage is only referenced while draining."""
+    while True:
+        wakeup.wait()
+        storage = storage_ref()
+        if storage is None:
+            return
+        wakeup.clear()
+        stopping = storage._write_pending()
+        storage = None
+        if stopping:
+            return
 
-        if filters.get("end_time") is not None:
-            clauses.append("timestamp <= ?")
-            params.append(filters["end_time"])
 
-        where_sql = f"WHERE {' AND '.join(clauses)}" if clauses else ""
-        return where_sql, tuple(params)
+def _release_unclosed(
+    conn: sqlite3.Connection,
+    lanes: Sequence["queue.SimpleQueue[Any]"],
+    wakeup: Event,
+    readers: "weakref.WeakSet[_Reader]",
+) -> None:
+    """Finalizer for a storage collected without `close()`.
+
+    Writes entries still queued, closes the connections and wakes the writer
+    thread so that it exits.
+    """
+    rows: List[Tuple[Any, ...]] = []
+    for lane in lanes:
+        while True:
+            try:
+                item = lane.get_nowait()
+            except queue.Empty:
+                break
+            if isinstance(item, Event):
+                item.set()
+                continue
+            try:
+                rows.append(_to_row(item))
+            except Exception as exc:
+                logger.exception("Dropping cost log for user %r: %s", item.user_id, exc)
+    try:
+        if rows:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.executemany(_INSERT_SQL, rows)
+            conn.execute("COMMIT")
+    except sqlite3.Error as exc:
+        logger.exception("Failed to write %d cost logs: %s", len(rows), exc)
+    finally:
+        for reader in list(readers):
+            reader.close()
+        conn.close()
+        wakeup.set()
+
+
+def _load_aggregates(
+    conn: sqlite3.Connection,
+) -> Tuple[float, Dict[str, Dict[str, List[Any]]]]:
+    """Scan the grand total and per-user/per-feature totals from one snapshot."""
+    conn.execute("BEGIN")
+    try:
+        grand_total = conn.execute(_TOTAL_SQL_NO_FILTER).fetchone()[0]
+        totals = {
+            column: {key: [total, count] for key, total, count in conn.execute(sql)}
+            for column, sql in _GROUPED_SQL_NO_FILTER.items()
+        }
+    finally:
+        conn.execute("COMMIT")
+    return grand_total, totals
+
+
+def _to_row(cost_log: CostLog) -> Tuple[Any, ...]:
+    """Build the insert parameters for one entry, encoding its metadata."""
+    # Rows are plain attribute reads; only non-empty metadata needs encoding.
+    # Adapters are deliberately not installed with `sqlite3.register_adapter`:
+    # that registry is process-wide and would change how the host
+    # application binds its own dict and datetime values.
+    return (
+        cost_log.user_id,
+        cost_log.feature,
+        cost_log.model,
+        cost_log.tokens_in,
+        cost_log.tokens_out,
+        cost_log.cost_usd,
+        cost_log.latency_ms,
+        cost_log.epoch_us,
+        cost_log.org_id,
+        _dump_metadata(cost_log.metadata) if cost_log.metadata else _EMPTY_METADATA,
+    )
+
+
+def _iso_to_epoch_us(value: str) -> int:
+    return datetime_to_epoch_us(datetime.fromisoformat(value))
+
+
+def _time_filter_value(value: TimeValue) -> int:
+    """Normalize a `start_time`/`end_time` filter to epoch microseconds."""
+    if isinstance(value, datetime):
+        return datetime_to_epoch_us(value)
+    if isinstance(value, str):
+        return _iso_to_epoch_us(value)
+    return int(value)
+
+
+# Filter keys in parameter order, with their SQL clause and value normalizer.
+_FILTERS: Tuple[Tuple[str, str, Optional[Callable[[Any], Any]]], ...] = (
+    ("user_id", "user_id = ?", None),
+    ("feature", "feature = ?", None),
+    ("org_id", "org_id = ?", None),
+    ("model", "model = ?", None),
+    ("start_time", "timestamp >= ?", _time_filter_value),
+    ("end_time", "timestamp <= ?", _time_filter_value),
+)
+
+# WHERE clause for every combination of present filters, keyed by bitmask.
+_WHERE_CACHE: Dict[int, str] = {
+    mask: (
+        "WHERE "
+        + " AND ".join(
+            clause for bit, (_, clause, _) in enumerate(_FILTERS) if mask & (1 << bit)
+        )
+        if mask
+        else ""
+    )
+    for mask in range(1 << len(_FILTERS))
+}
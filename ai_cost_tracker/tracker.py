@@ -3,12 +3,12 @@
 from __future__ import annotations
 
 import logging
-import time
-from datetime import datetime, timezone
 from functools import wraps
+from inspect import iscoroutinefunction
+from time import perf_counter
 from typing import Any, Callable, Dict, Optional, Tuple, Union
 
-from .models import CostLog
+from .models import CostLog, epoch_us_now
 from .pricing import calculate_cost
 from .storage import SQLiteStorage
 
@@ -16,6 +16,11 @@ logger = logging.getLogger(__name__)
 
 FieldValue = Union[str, Callable[[], str]]
 MetadataValue = Union[Dict[str, Any], Callable[[], Dict[str, Any]], None]
+UsageExtractor = Callable[[Any], Tuple[int, int]]
+
+_MISSING = object()
+# Token extractor per usage class, chosen on first sighting of that class.
+_USAGE_EXTRACTORS: Dict[type, UsageExtractor] = {}
 
 _storage: Optional[SQLiteStorage] = None
 _org_id: str = "default"
@@ -48,14 +53,20 @@ def track_costs(
     a model identifier and token usage information.
     """
 
+    # Static values are resolved once here instead of on every call.
+    if not callable(user_id):
+        user_id = _resolve_field(user_id, "unknown_user")
+    if not callable(feature):
+        feature = _resolve_field(feature, "unknown_feature")
+
     def decorator(func: Callable[..., Any]) -> Callable[..., Any]:
-        if _is_coroutine_function(func):
+        if iscoroutinefunction(func):
 
             @wraps(func)
             async def async_wrapper(*args: Any, **kwargs: Any) -> Any:
-                start = time.perf_counter()
+                start = perf_counter()
                 result = await func(*args, **kwargs)
-                latency_ms = int((time.perf_counter() - start) * 1000)
+                latency_ms = int((perf_counter() - start) * 1000)
                 _safe_log_response(result, user_id, feature, metadata, latency_ms)
                 return result
 
@@ -63,9 +74,9 @@ def track_costs(
 
         @wraps(func)
         def sync_wrapper(*args: Any, **kwargs: Any) -> Any:
-            start = time.perf_counter()
+            start = perf_counter()
             result = func(*args, **kwargs)
-            latency_ms = int((time.perf_counter() - start) * 1000)
+            latency_ms = int((perf_counter() - start) * 1000)
             _safe_log_response(result, user_id, feature, metadata, latency_ms)
             return result
 
@@ -90,20 +101,48 @@ def track_manual(
     if latency_ms < 0:
         raise ValueError("latency_ms must be non-negative")
 
-    cost = calculate_cost(model, tokens_in, tokens_out)
-    entry = CostLog(
+    return _record(
         user_id=user_id,
         feature=feature,
         model=model,
         tokens_in=tokens_in,
         tokens_out=tokens_out,
-        cost_usd=cost,
         latency_ms=latency_ms,
-        timestamp=datetime.now(timezone.utc),
+        # Copied because serialization happens later on the writer thread.
+        metadata=dict(metadata) if metadata else {},
         org_id=org_id or _org_id,
-        metadata=metadata or {},
     )
-    get_storage().log(entry)
+
+
+def _record(
+    user_id: str,
+    feature: str,
+    model: str,
+    tokens_in: int,
+    tokens_out: int,
+    latency_ms: int,
+    metadata: Dict[str, Any],
+    org_id: str,
+) -> CostLog:
+    """Build and enqueue a log entry from metadata the caller owns.
+
+    Negative token counts from provider responses are rejected by
+    `calculate_cost`.
+    """
+    entry = CostLog(
+        user_id=user_id,
+        feature=feature,
+        model=model,
+        tokens_in=tokens_in,
+        tokens_out=tokens_out,
+        cost_usd=calculate_cost(model, tokens_in, tokens_out),
+        latency_ms=latency_ms,
+        org_id=org_id,
+        metadata=metadata,
+        epoch_us=epoch_us_now(),
+    )
+    storage = _storage if _storage is not None else get_storage()
+    storage.log(entry)
     return entry
 
 
@@ -116,14 +155,20 @@ def _safe_log_response(
 ) -> None:
     try:
         model, tokens_in, tokens_out = _extract_usage(response)
-        track_manual(
-            user_id=_resolve_field(user_id, "unknown_user"),
-            feature=_resolve_field(feature, "unknown_feature"),
+        # Static strings were already resolved by `track_costs`.
+        if not isinstance(user_id, str):
+            user_id = _resolve_field(user_id, "unknown_user")
+        if not isinstance(feature, str):
+            feature = _resolve_field(feature, "unknown_feature")
+        _record(
+            user_id=user_id,
+            feature=feature,
             model=model,
             tokens_in=tokens_in,
             tokens_out=tokens_out,
             latency_ms=latency_ms,
-            metadata=_resolve_metadata(metadata),
+            metadata=_resolve_metadata(metadata) if metadata is not None else {},
+            org_id=_org_id,
         )
     except Exception as exc:  # pragma: no cover - defensive path
         logger.exception("Failed to record cost log: %s", exc)
@@ -135,11 +180,7 @@ def _extract_usage(response: Any) -> Tuple[str, int, int]:
 
     if isinstance(response, dict):
         model = str(response.get("model", "unknown"))
-        usage = response.get("usage") or {}
-        tokens_in = _int_value(usage.get("prompt_tokens", usage.get("input_tokens", 0)))
-        tokens_out = _int_value(
-            usage.get("completion_tokens", usage.get("output_tokens", 0))
-        )
+        tokens_in, tokens_out = _dict_usage(response.get("usage") or {})
         return model, tokens_in, tokens_out
 
     model = str(getattr(response, "model", "unknown"))
@@ -148,19 +189,69 @@ def _extract_usage(response: Any) -> Tuple[str, int, int]:
         raise ValueError("Response does not contain usage information")
 
     if isinstance(usage, dict):
-        tokens_in = _int_value(usage.get("prompt_tokens", usage.get("input_tokens", 0)))
-        tokens_out = _int_value(
-            usage.get("completion_tokens", usage.get("output_tokens", 0))
-        )
+        tokens_in, tokens_out = _dict_usage(usage)
         return model, tokens_in, tokens_out
 
-    tokens_in = _int_value(
-        getattr(usage, "prompt_tokens", getattr(usage, "input_tokens", 0))
+    extractor = _USAGE_EXTRACTORS.get(type(usage))
+    if extractor is None:
+        extractor = _USAGE_EXTRACTORS[type(usage)] = _select_usage_extractor(usage)
+    try:
+        tokens_in, tokens_out = extractor(usage)
+    except AttributeError:
+        # Instances of one class may not share a shape; use the full lookup.
+        tokens_in, tokens_out = _generic_usage(usage)
+    return model, tokens_in, tokens_out
+
+
+def _dict_usage(usage: Dict[str, Any]) -> Tuple[int, int]:
+    tokens_in = (
+        usage["prompt_tokens"] if "prompt_tokens" in usage else usage.get("input_tokens", 0)
     )
-    tokens_out = _int_value(
-        getattr(usage, "completion_tokens", getattr(usage, "output_tokens", 0))
+    tokens_out = (
+        usage["completion_tokens"]
+        if "completion_tokens" in usage
+        else usage.get("output_tokens", 0)
     )
-    return model, tokens_in, tokens_out
+    return _int_value(tokens_in), _int_value(tokens_out)
+
+
+def _openai_usage(usage: Any) -> Tuple[int, int]:
+    return _int_value(usage.prompt_tokens), _int_value(usage.completion_tokens)
+
+
+def _anthropic_usage(usage: Any) -> Tuple[int, int]:
+    # Models allowing extra fields may carry OpenAI-style counts on some
+    # instances only; those take precedence, as in `_generic_usage`.
+    if (
+        getattr(usage, "prompt_tokens", _MISSING) is not _MISSING
+        or getattr(usage, "completion_tokens", _MISSING) is not _MISSING
+    ):
+        return _generic_usage(usage)
+    return _int_value(usage.input_tokens), _int_value(usage.output_tokens)
+
+
+def _generic_usage(usage: Any) -> Tuple[int, int]:
+    tokens_in = getattr(usage, "prompt_tokens", _MISSING)
+    if tokens_in is _MISSING:
+        tokens_in = getattr(usage, "input_tokens", 0)
+    tokens_out = getattr(usage, "completion_tokens", _MISSING)
+    if tokens_out is _MISSING:
+        tokens_out = getattr(usage, "output_tokens", 0)
+    return _int_value(tokens_in), _int_value(tokens_out)
+
+
+def _select_usage_extractor(usage: Any) -> UsageExtractor:
+    """Pick the token extractor matching the shape of a usage object."""
+    if hasattr(usage, "prompt_tokens") and hasattr(usage, "completion_tokens"):
+        return _openai_usage
+    if (
+        not hasattr(usage, "prompt_tokens")
+        and not hasattr(usage, "completion_tokens")
+        and hasattr(usage, "input_tokens")
+        and hasattr(usage, "output_tokens")
+    ):
+        return _anthropic_usage
+    return _generic_usage
 
 
 def _resolve_field(value: FieldValue, fallback: str) -> str:
@@ -186,12 +277,3 @@ def _int_value(value: Any) -> int:
         return int(value)
     except (TypeError, ValueError):
         return 0
-
-
-def _is_coroutine_function(func: Callable[..., Any]) -> bool:
-    try:
-        import inspect
-
-        return inspect.iscoroutinefunction(func)
-    except Exception:
-        return False
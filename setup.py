@@ -14,6 +14,7 @@ setup(
     packages=find_packages(),
     python_requires=">=3.8",
     install_requires=["openai>=1.0.0", "anthropic>=0.18.0"],
+    extras_require={"fast": ["orjson>=3.6"]},
     classifiers=[
         "Programming Language :: Python :: 3",
         "Programming Language :: Python :: 3.8",
@@ -1,8 +1,14 @@
 from __future__ import annotations
 
-from datetime import datetime, timezone
+import asyncio
+import gc
+import json
+import sqlite3
+from dataclasses import asdict, fields
+from datetime import datetime, timedelta, timezone
 from pathlib import Path
 from tempfile import TemporaryDirectory
+from threading import Thread
 
 from ai_cost_tracker import (
     CostLog,
@@ -10,8 +16,16 @@ from ai_cost_tracker import (
     get_model_pricing,
     init_tracker,
     track_costs,
+    track_manual,
 )
+from ai_cost_tracker import storage as storage_module
 from ai_cost_tracker.storage import SQLiteStorage
+from ai_cost_tracker.tracker import (
+    _USAGE_EXTRACTORS,
+    _anthropic_usage,
+    _extract_usage,
+    _openai_usage,
+)
 
 
 def test_pricing_exact_and_partial_model_matches() -> None:
@@ -25,6 +39,38 @@ def test_pricing_exact_and_partial_model_matches() -> None:
     assert partial_cost == expected
 
 
+def test_pricing_aliases_and_normalized_names() -> None:
+    assert get_model_pricing("claude-3-5-sonnet-20241022") == get_model_pricing(
+        "claude-sonnet-3.5"
+    )
+    assert get_model_pricing("claude-3-opus") == get_model_pricing("claude-opus-4")
+    assert get_model_pricing(" GPT_4o-Mini ") == (0.15, 0.6)
+    assert get_model_pricing("openai/gpt-4-turbo-2024") == (10.0, 30.0)
+
+
+def test_cost_log_epoch_us_and_timestamp() -> None:
+    explicit = datetime(2024, 1, 2, 3, 4, 5, 678901, tzinfo=timezone.utc)
+    entry = CostLog("u", "f", "gpt-4o", 1, 1, 0.1, 1, timestamp=explicit)
+    assert entry.epoch_us == 1704164645678901
+    assert entry.timestamp is explicit
+    assert entry.to_dict()["timestamp"] == explicit.isoformat()
+
+    from_epoch = CostLog("u", "f", "gpt-4o", 1, 1, 0.1, 1, epoch_us=1704164645678901)
+    assert from_epoch.timestamp == explicit
+    assert asdict(from_epoch)["timestamp"] == explicit
+    assert [item.name for item in fields(CostLog)][-4:] == [
+        "timestamp",
+        "org_id",
+        "metadata",
+        "epoch_us",
+    ]
+
+    assert CostLog("u", "f", "gpt-4o", 1, 1, 0.1, 1, epoch_us=0).timestamp == datetime(
+        1970, 1, 1, tzinfo=timezone.utc
+    )
+    assert CostLog("u", "f", "gpt-4o", 1, 1, 0.1, 1).epoch_us > 0
+
+
 def test_storage_log_query_and_rankings() -> None:
     with TemporaryDirectory() as tmp_dir:
         db_path = str(Path(tmp_dir) / "costs.db")
@@ -129,3 +175,416 @@ def test_decorator_with_mock_anthropic_response_shape() -> None:
 
         total = storage.get_total_cost(filters={"user_id": "user-2", "feature": "analysis"})
         assert total > 0.0
+
+
+def test_decorator_with_async_dict_response() -> None:
+    with TemporaryDirectory() as tmp_dir:
+        db_path = str(Path(tmp_dir) / "decorator_async.db")
+        storage = init_tracker(db_path, org_id="org-decorator")
+
+        @track_costs(user_id="user-3", feature="stream")
+        async def make_call() -> dict:
+            return {"model": "gpt-4o", "usage": {"prompt_tokens": 100, "completion_tokens": 50}}
+
+        _ = asyncio.run(make_call())
+
+        total = storage.get_total_cost(filters={"user_id": "user-3"})
+        assert total == calculate_cost("gpt-4o", 100, 50)
+
+
+def test_track_manual_rejects_negative_values() -> None:
+    for tokens_in, latency_ms, message in (
+        (-1, -1, "tokens_in and tokens_out must be non-negative"),
+        (1, -1, "latency_ms must be non-negative"),
+    ):
+        try:
+            track_manual("user", "chat", "gpt-4o", tokens_in, 1, latency_ms=latency_ms)
+        except ValueError as exc:
+            assert str(exc) == message
+        else:
+            raise AssertionError("expected ValueError")
+
+
+def test_usage_extractor_is_memoized_per_usage_class() -> None:
+    class Usage:
+        def __init__(self, **tokens: int) -> None:
+            self.__dict__.update(tokens)
+
+    class OpenAIUsage(Usage):
+        pass
+
+    class AnthropicUsage(Usage):
+        pass
+
+    class Response:
+        model = "gpt-4o"
+
+        def __init__(self, usage: Usage) -> None:
+            self.usage = usage
+
+    for _ in range(2):
+        openai_response = Response(OpenAIUsage(prompt_tokens=10, completion_tokens=5))
+        anthropic_response = Response(AnthropicUsage(input_tokens=7, output_tokens=3))
+        assert _extract_usage(openai_response) == ("gpt-4o", 10, 5)
+        assert _extract_usage(anthropic_response) == ("gpt-4o", 7, 3)
+    assert _USAGE_EXTRACTORS[OpenAIUsage] is _openai_usage
+    assert _USAGE_EXTRACTORS[AnthropicUsage] is _anthropic_usage
+
+    # The first instance fixes the class's extractor; a differently shaped
+    # instance of the same class falls back to the generic lookup.
+    assert _extract_usage(Response(Usage(prompt_tokens=4, completion_tokens=2))) == (
+        "gpt-4o",
+        4,
+        2,
+    )
+    assert _extract_usage(Response(Usage(input_tokens=8, output_tokens=1))) == ("gpt-4o", 8, 1)
+    assert _USAGE_EXTRACTORS[Usage] is _openai_usage
+
+    # OpenAI-style counts on an instance of a class cached as Anthropic-shaped
+    # still take precedence.
+    assert _extract_usage(Response(AnthropicUsage(input_tokens=1, output_tokens=1))) == (
+        "gpt-4o",
+        1,
+        1,
+    )
+    mixed = AnthropicUsage(prompt_tokens=5, completion_tokens=3, input_tokens=0, output_tokens=0)
+    assert _extract_usage(Response(mixed)) == ("gpt-4o", 5, 3)
+    assert _USAGE_EXTRACTORS[AnthropicUsage] is _anthropic_usage
+
+
+def test_storage_close_persists_queued_entries() -> None:
+    with TemporaryDirectory() as tmp_dir:
+        db_path = str(Path(tmp_dir) / "queued.db")
+        storage = SQLiteStorage(db_path)
+        for index in range(50):
+            storage.log(
+                CostLog(
+                    user_id=f"user-{index % 5}",
+                    feature="chat",
+                    model="gpt-4o-mini",
+                    tokens_in=10,
+                    tokens_out=10,
+                    cost_usd=0.001,
+                    latency_ms=5,
+                )
+            )
+        storage.close()
+
+        reopened = SQLiteStorage(db_path)
+        assert round(reopened.get_total_cost(), 8) == round(50 * 0.001, 8)
+        assert len(reopened.get_top_users(limit=10)) == 5
+        reopened.close()
+
+
+def test_replaced_and_unclosed_storages_release_writer_threads() -> None:
+    with TemporaryDirectory() as tmp_dir:
+        db_path = str(Path(tmp_dir) / "lifecycle.db")
+        kept = init_tracker(db_path)
+        storage = init_tracker(db_path)
+        writers = [storage._writer]
+        storage.log(
+            CostLog(
+                user_id="user-1",
+                feature="chat",
+                model="gpt-4o",
+                tokens_in=1,
+                tokens_out=1,
+                cost_usd=1.0,
+                latency_ms=1,
+            )
+        )
+        for _ in range(4):
+            # Rebinding drops the last reference to the replaced storage.
+            storage = init_tracker(db_path)
+            writers.append(storage._writer)
+        gc.collect()
+
+        for writer in writers[:-1]:
+            writer.join(timeout=5)
+            assert not writer.is_alive()
+        assert writers[-1].is_alive()
+        assert storage.get_total_cost() == 1.0
+        assert kept.get_total_cost() == 1.0
+        kept.close()
+        storage.close()
+
+
+def test_storage_log_from_many_threads() -> None:
+    with TemporaryDirectory() as tmp_dir:
+        db_path = str(Path(tmp_dir) / "producers.db")
+        storage = SQLiteStorage(db_path)
+
+        def produce(worker: int) -> None:
+            for _ in range(200):
+                storage.log(
+                    CostLog(
+                        user_id=f"worker-{worker}",
+                        feature="chat",
+                        model="gpt-4o-mini",
+                        tokens_in=1,
+                        tokens_out=1,
+                        cost_usd=0.5,
+                        latency_ms=1,
+                    )
+                )
+
+        threads = [Thread(target=produce, args=(worker,)) for worker in range(12)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert storage.get_total_cost() == 12 * 200 * 0.5
+        assert storage.get_total_cost(filters={"feature": "chat"}) == 12 * 200 * 0.5
+        assert {calls for _, _, calls in storage.get_top_users(limit=20)} == {200}
+        storage.close()
+
+
+def test_single_producer_can_use_the_whole_queue() -> None:
+    with TemporaryDirectory() as tmp_dir:
+        db_path = str(Path(tmp_dir) / "single_producer.db")
+        # Use several lanes regardless of the host's CPU count.
+        lanes = storage_module._QUEUE_LANES
+        storage_module._QUEUE_LANES = 8
+        try:
+            storage = SQLiteStorage(db_path)
+        finally:
+            storage_module._QUEUE_LANES = lanes
+        count = 3_000
+
+        def produce() -> None:
+            for index in range(count):
+                storage.log(
+                    CostLog(
+                        user_id=f"user-{index % 3}",
+                        feature="chat",
+                        model="gpt-4o",
+                        tokens_in=1,
+                        tokens_out=1,
+                        cost_usd=1.0,
+                        latency_ms=1,
+                    )
+                )
+
+        # While the writer is stalled, a synchronous fallback insert would
+        # block on the same lock; a bounded producer must not need one.
+        producer = Thread(target=produce)
+        with storage._lock:
+            producer.start()
+            producer.join(timeout=5)
+            assert not producer.is_alive()
+
+        assert storage.get_total_cost() == float(count)
+        storage.close()
+
+
+def test_storage_reads_from_multiple_threads() -> None:
+    with TemporaryDirectory() as tmp_dir:
+        db_path = str(Path(tmp_dir) / "readers.db")
+        storage = SQLiteStorage(db_path)
+        storage.log(
+            CostLog(
+                user_id="carol",
+                feature="chat",
+                model="gpt-4o",
+                tokens_in=10,
+                tokens_out=10,
+                cost_usd=0.25,
+                latency_ms=5,
+            )
+        )
+
+        results = []
+
+        def read() -> None:
+            results.append(storage.get_total_cost(filters={"user_id": "carol"}))
+
+        threads = [Thread(target=read) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert results == [0.25] * 4
+        storage.close()
+
+
+def test_reader_connections_close_when_threads_exit() -> None:
+    with TemporaryDirectory() as tmp_dir:
+        db_path = str(Path(tmp_dir) / "readers.db")
+        storage = SQLiteStorage(db_path)
+        open_readers = len(storage._readers)
+
+        for index in range(20):
+            thread = Thread(
+                target=storage.get_total_cost, args=({"user_id": f"user-{index}"},)
+            )
+            thread.start()
+            thread.join()
+        gc.collect()
+
+        assert len(storage._readers) == open_readers
+        storage.close()
+
+
+def test_unfiltered_aggregates_see_writes_from_other_connections() -> None:
+    with TemporaryDirectory() as tmp_dir:
+        db_path = str(Path(tmp_dir) / "shared.db")
+        reader = SQLiteStorage(db_path)
+        writer = SQLiteStorage(db_path)
+        assert reader.get_top_users() == []
+
+        for user_id, cost in (("dave", 0.5), ("erin", 0.2), ("dave", 0.1)):
+            writer.log(
+                CostLog(
+                    user_id=user_id,
+                    feature="chat",
+                    model="gpt-4o",
+                    tokens_in=10,
+                    tokens_out=10,
+                    cost_usd=cost,
+                    latency_ms=5,
+                )
+            )
+        writer.flush()
+
+        assert round(reader.get_total_cost(), 8) == 0.8
+        top_users = reader.get_top_users(limit=1)
+        assert [(user, round(cost, 8), calls) for user, cost, calls in top_users] == [
+            ("dave", 0.6, 2)
+        ]
+        top_features = reader.get_top_features()
+        assert [(name, round(cost, 8), calls) for name, cost, calls in top_features] == [
+            ("chat", 0.8, 3)
+        ]
+        writer.close()
+        reader.close()
+
+
+def test_time_range_filters_and_text_timestamp_migration() -> None:
+    with TemporaryDirectory() as tmp_dir:
+        db_path = str(Path(tmp_dir) / "legacy.db")
+        now = datetime.now(timezone.utc)
+        legacy = sqlite3.connect(db_path)
+        legacy.execute(
+            """
+            CREATE TABLE cost_logs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id TEXT NOT NULL,
+                feature TEXT NOT NULL,
+                model TEXT NOT NULL,
+                tokens_in INTEGER NOT NULL,
+                tokens_out INTEGER NOT NULL,
+                cost_usd REAL NOT NULL,
+                latency_ms INTEGER NOT NULL,
+                timestamp TEXT NOT NULL,
+                org_id TEXT NOT NULL,
+                metadata TEXT NOT NULL
+            )
+            """
+        )
+        legacy.execute(
+            "INSERT INTO cost_logs (user_id, feature, model, tokens_in, tokens_out, "
+            "cost_usd, latency_ms, timestamp, org_id, metadata) "
+            "VALUES ('old', 'chat', 'gpt-4o', 1, 1, 0.5, 1, ?, 'default', '{}')",
+            ((now - timedelta(days=2)).isoformat(),),
+        )
+        legacy.commit()
+        legacy.close()
+
+        storage = SQLiteStorage(db_path)
+        storage.log(
+            CostLog(
+                user_id="new",
+                feature="chat",
+                model="gpt-4o",
+                tokens_in=1,
+                tokens_out=1,
+                cost_usd=0.25,
+                latency_ms=1,
+                timestamp=now,
+            )
+        )
+
+        assert storage.get_total_cost() == 0.75
+        day_ago = now - timedelta(days=1)
+        assert storage.get_total_cost(filters={"start_time": day_ago}) == 0.25
+        assert storage.get_total_cost(filters={"end_time": day_ago.isoformat()}) == 0.5
+        storage.close()
+
+
+def test_filtered_query_results_refresh_after_new_writes() -> None:
+    with TemporaryDirectory() as tmp_dir:
+        db_path = str(Path(tmp_dir) / "cached.db")
+        storage = SQLiteStorage(db_path)
+        filters = {"org_id": "org-cache"}
+
+        def log_cost(user_id: str, cost: float) -> None:
+            storage.log(
+                CostLog(
+                    user_id=user_id,
+                    feature="chat",
+                    model="gpt-4o",
+                    tokens_in=1,
+                    tokens_out=1,
+                    cost_usd=cost,
+                    latency_ms=1,
+                    org_id="org-cache",
+                )
+            )
+
+        log_cost("frank", 0.5)
+        assert storage.get_total_cost(filters=filters) == 0.5
+        assert storage.get_top_users(filters=filters) == [("frank", 0.5, 1)]
+
+        log_cost("grace", 1.0)
+        assert storage.get_total_cost(filters=filters) == 1.5
+        assert storage.get_top_users(filters=filters) == [("grace", 1.0, 1), ("frank", 0.5, 1)]
+        storage.close()
+
+
+def test_metadata_outside_orjson_range_is_stored() -> None:
+    with TemporaryDirectory() as tmp_dir:
+        db_path = str(Path(tmp_dir) / "metadata.db")
+        storage = SQLiteStorage(db_path)
+        storage.log(
+            CostLog(
+                user_id="heidi",
+                feature="chat",
+                model="gpt-4o",
+                tokens_in=1,
+                tokens_out=1,
+                cost_usd=0.5,
+                latency_ms=1,
+                metadata={"n": 2**70, "label": "café"},
+            )
+        )
+        storage.close()
+
+        conn = sqlite3.connect(db_path)
+        (metadata,) = conn.execute("SELECT metadata FROM cost_logs").fetchone()
+        conn.close()
+        assert json.loads(metadata) == {"n": 2**70, "label": "café"}
+
+
+def test_unserializable_metadata_only_drops_that_entry() -> None:
+    with TemporaryDirectory() as tmp_dir:
+        db_path = str(Path(tmp_dir) / "partial.db")
+        storage = SQLiteStorage(db_path)
+        for index in range(20):
+            storage.log(
+                CostLog(
+                    user_id=f"user-{index}",
+                    feature="chat",
+                    model="gpt-4o",
+                    tokens_in=1,
+                    tokens_out=1,
+                    cost_usd=1.0,
+                    latency_ms=1,
+                    metadata={"x": object()} if index == 7 else {"index": index},
+                )
+            )
+
+        assert storage.get_total_cost() == 19.0
+        assert storage.dropped_logs == 1
+        storage.close()